@@ -3,9 +3,19 @@
 # Compute END limits on OC and CC
 # Compute soft limit on gas density (5.2g/l) and hard limit (6.2g/l) for OC, and then for CC with different SPs
 
+import argparse
+import csv
+import math
+import re
 import sys
+from functools import lru_cache
 
 
+# Matches '18/35' (O2/He) or '50' (O2 only), optionally surrounded by whitespace
+_TRIMIX_RE = re.compile(r'\s*(\d{1,3})(?:\s*/\s*(\d{1,3}))?\s*')
+
+
+@lru_cache(maxsize=512)
 def parse_trimix(trimix):
     """
     Parses a trimix string and returns the percentages of O2, He, and N2.
@@ -15,16 +25,21 @@ def parse_trimix(trimix):
 
     Returns:
     tuple: Percentages of O2, He, and N2.
+
+    Results are cached per input string; use parse_trimix.cache_clear() to reset the cache.
     """
-    if '/' in trimix:
-        o2, he = map(int, trimix.split('/'))
-        n2 = 100 - o2 - he
-    else:
-        o2 = int(trimix)
-        he = 0
-        n2 = 100 - o2
+    match = _TRIMIX_RE.fullmatch(trimix)
+    if match is None:
+        raise ValueError(f"Invalid trimix specification: {trimix!r}")
+
+    o2 = int(match.group(1))
+    he = int(match.group(2)) if match.group(2) else 0
+    if o2 == 0:
+        raise ValueError(f"Mix without O2 is not breathable: {trimix!r}")
+    if o2 + he > 100:
+        raise ValueError(f"O2 and He add up to more than 100% in {trimix!r}")
 
-    return o2, he, n2
+    return o2, he, 100 - o2 - he
 
 
 def calculate_depth_for_po2(target_po2, oxygen_percentage):
@@ -38,8 +53,8 @@ def calculate_depth_for_po2(target_po2, oxygen_percentage):
     Returns:
     float: Depth in meters at which the target PO2 is achieved.
     """
-    frac_o2 = oxygen_percentage / 100
-    depth = (target_po2 / frac_o2 - 1) * 10
+    # target_po2 / (oxygen_percentage / 100), with a single division
+    depth = (target_po2 * 100 / oxygen_percentage - 1) * 10
     return depth
 
 
@@ -53,10 +68,13 @@ def find_depth_for_30m_end(n2_percentage):
     Returns:
     float: Depth in meters at which the END is 30 meters.
     """
-    frac_n2_mix = n2_percentage / 100  # Fraction of N2 in the mix
+    if n2_percentage <= 0:
+        raise ValueError("END cannot reach 30 meters without nitrogen in the mix.")
+
     target_ppn2_air_30m = 0.79 * 4  # PPN2 when breathing air at 30 meters
 
-    depth = (target_ppn2_air_30m / frac_n2_mix - 1) * 10
+    # target_ppn2_air_30m / (n2_percentage / 100), with a single division
+    depth = (target_ppn2_air_30m * 100 / n2_percentage - 1) * 10
     return depth
 
 
@@ -65,6 +83,9 @@ SPECIFIC_GRAVITY_O2 = 1.429
 SPECIFIC_GRAVITY_N2 = 1.2506
 SPECIFIC_GRAVITY_HE = 0.1786
 
+# The same specific gravities in (O2, N2, He) order, for dot products with mix compositions
+_SPECIFIC_GRAVITIES = (SPECIFIC_GRAVITY_O2, SPECIFIC_GRAVITY_N2, SPECIFIC_GRAVITY_HE)
+
 
 def calculate_depth_for_gas_density(o2_percentage, he_percentage, target_density):
     """
@@ -79,26 +100,101 @@ def calculate_depth_for_gas_density(o2_percentage, he_percentage, target_density
     Returns:
     float: Depth in meters at which the target gas density is reached.
     """
+    n2_percentage = 100 - o2_percentage - he_percentage
 
-    # Convert percentages to fractions
-    frac_o2 = o2_percentage / 100
-    frac_he = he_percentage / 100
-    frac_n2 = 1 - frac_o2 - frac_he
+    # Density grows linearly with ambient pressure, so solve for the depth directly. The specific gravity is kept
+    # scaled by 100 so the percentages need no conversion to fractions.
+    mix_sg_percent = (o2_percentage * SPECIFIC_GRAVITY_O2 + n2_percentage * SPECIFIC_GRAVITY_N2 +
+                      he_percentage * SPECIFIC_GRAVITY_HE)
 
-    # Initialize depth
-    depth = 0
+    # First whole meter at which the target density is reached or exceeded
+    depth = math.ceil(10 * (target_density * 100 / mix_sg_percent - 1))
+    return max(depth, 0)
 
-    # Increment depth until the target density is reached or exceeded
-    while True:
-        total_pressure = 1 + depth / 10  # Total pressure at depth (in ATA)
-        density = total_pressure * (
-                frac_o2 * SPECIFIC_GRAVITY_O2 + frac_n2 * SPECIFIC_GRAVITY_N2 + frac_he * SPECIFIC_GRAVITY_HE)
 
-        if density >= target_density:
-            break
-        depth += 1
+def _inert_specific_gravity(he_percentage, n2_percentage):
+    """
+    Calculate the specific gravity of the inert (non-O2) share of a gas mix.
 
-    return depth
+    Parameters:
+    he_percentage (float): Percentage of helium in the gas mix.
+    n2_percentage (float): Percentage of nitrogen in the gas mix.
+
+    Returns:
+    float: Specific gravity in g/l of the He/N2 portion, or 0 if the mix contains no inert gas.
+    """
+    total_inert = he_percentage + n2_percentage
+    if total_inert <= 0:
+        return 0.0
+
+    # He and N2 make up the whole non-O2 portion in the same ratio as in the mix
+    frac_he = he_percentage / total_inert
+    frac_n2 = n2_percentage / total_inert
+    return frac_he * SPECIFIC_GRAVITY_HE + frac_n2 * SPECIFIC_GRAVITY_N2
+
+
+# Depth in meters at which the CC solvers start, and the ambient pressure in bar there
+_CC_START_DEPTH = 10
+_CC_START_PRESSURE = 1 + _CC_START_DEPTH / 10
+
+
+def _check_set_point_reachable(set_point):
+    """
+    Raise a ValueError if a set point cannot be reached at the CC start depth.
+
+    Parameters:
+    set_point (float): Set point for PO2, or the highest of several set points.
+    """
+    if set_point >= _CC_START_PRESSURE:
+        raise ValueError("Set point cannot be reached with the initial mix.")
+
+
+def _cc_ambient_pressure(k_inert, set_point, target_density):
+    """
+    Calculate the ambient pressure at which a mix adjusted to a set point reaches a target gas density.
+
+    With frac_o2 = set_point / P the density is set_point * SG_O2 + (P - set_point) * k_inert, which is linear in P.
+    Works element-wise on NumPy arrays as well.
+
+    Parameters:
+    k_inert (float): Specific gravity in g/l of the He/N2 portion of the mix, as from _inert_specific_gravity.
+    set_point (float): Set point for PO2.
+    target_density (float): Target gas density in g/l.
+
+    Returns:
+    float: Ambient pressure in bar at which the target gas density is reached.
+    """
+    return set_point + (target_density - set_point * SPECIFIC_GRAVITY_O2) / k_inert
+
+
+def _cc_depth_grid(k_inert, set_points, target_densities):
+    """
+    Calculate CC gas density depths with NumPy, using the same solution as calculate_depth_for_sp_and_density.
+
+    Parameters:
+    k_inert (float or numpy.ndarray): Specific gravity of the He/N2 portion of one or more mixes; NaN marks an
+        invalid mix.
+    set_points (numpy.ndarray): Set points for PO2.
+    target_densities (numpy.ndarray): Target gas densities in g/l.
+
+    Returns:
+    numpy.ndarray: Depths in meters of shape k_inert.shape + (n_density, n_sp); NaN where a target cannot be reached.
+    """
+    import numpy as np
+
+    _check_set_point_reachable(set_points.max(initial=0))
+
+    k_inert = np.asarray(k_inert, dtype=np.float64)[..., None, None]
+    set_points = set_points[None, :]
+    target_densities = target_densities[:, None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ambient_pressure = _cc_ambient_pressure(k_inert, set_points, target_densities)
+        depths = np.maximum(np.ceil(10 * (ambient_pressure - 1)), _CC_START_DEPTH)
+
+    # Mixes without inert gas are handled like the scalar solver does
+    no_inert = np.where(set_points * SPECIFIC_GRAVITY_O2 >= target_densities, _CC_START_DEPTH, np.nan)
+    return np.where(k_inert == 0, no_inert, depths)
 
 
 def calculate_depth_for_sp_and_density(initial_o2_percentage, initial_he_percentage, initial_n2_percentage, set_point,
@@ -116,72 +212,223 @@ def calculate_depth_for_sp_and_density(initial_o2_percentage, initial_he_percent
     Returns:
     float: Depth in meters at which the target gas density is reached for the adjusted mix.
     """
-    # Start from an initial depth of 10 meters
-    depth = 10
+    _check_set_point_reachable(set_point)
 
-    while True:
-        # Calculate ambient pressure at current depth
-        ambient_pressure = 1 + depth / 10
+    k_inert = _inert_specific_gravity(initial_he_percentage, initial_n2_percentage)
+    if k_inert <= 0:
+        # Without inert gas the density stays at set_point * SG_O2 at every depth
+        if set_point * SPECIFIC_GRAVITY_O2 >= target_density:
+            return _CC_START_DEPTH
+        raise ValueError("Target density cannot be reached without inert gas in the mix.")
 
-        # Calculate the frac_o2 needed to reach the set point at this depth
-        frac_o2 = set_point / ambient_pressure
-        if frac_o2 >= 1.0:
-            raise ValueError("Set point cannot be reached with the initial mix.")
+    ambient_pressure = _cc_ambient_pressure(k_inert, set_point, target_density)
 
-        # Adjust He and N2 fractions based on the new O2 fraction
-        total_he_n2 = 1 - frac_o2
-        frac_he = initial_he_percentage / 100 * total_he_n2
-        frac_n2 = initial_n2_percentage / 100 * total_he_n2
+    # First whole meter at which the target density is reached or exceeded
+    depth = math.ceil(10 * (ambient_pressure - 1))
+    return max(depth, _CC_START_DEPTH)
 
-        # Calculate gas density of current gas composition
-        density = ambient_pressure * (
-                    frac_o2 * SPECIFIC_GRAVITY_O2 + frac_n2 * SPECIFIC_GRAVITY_N2 + frac_he * SPECIFIC_GRAVITY_HE)
 
-        # Check if the gas density exceeds the target density
-        if density >= target_density:
-            return depth
+def compute_density_depths(initial_o2_percentage, initial_he_percentage, initial_n2_percentage, set_points,
+                           target_densities):
+    """
+    Calculate the depths at which the target gas densities are reached for every combination of set point and
+    target density, using the same closed-form solution as calculate_depth_for_sp_and_density. Requires NumPy.
 
-        # Increase depth by 1 meter for next iteration
-        depth += 1
+    Parameters:
+    initial_o2_percentage (float): Initial percentage of oxygen in the gas mix.
+    initial_he_percentage (float): Initial percentage of helium in the gas mix.
+    initial_n2_percentage (float): Initial percentage of nitrogen in the gas mix.
+    set_points (array-like): Set points for PO2.
+    target_densities (array-like): Target gas densities in g/l.
 
-    # Return the depth if the loop exits (which should not normally happen)
-    return depth
+    Returns:
+    numpy.ndarray: Depths in meters, one row per target density and one column per set point.
+    """
+    # NumPy is only needed for the batch solvers, so keep it off the import path of the CLI
+    import numpy as np
 
+    set_points = np.asarray(set_points, dtype=np.float64)
+    target_densities = np.asarray(target_densities, dtype=np.float64)
 
-if __name__ == '__main__':
-    # Check if the trimix specification is provided as a command line argument
-    if len(sys.argv) != 2:
-        print("Usage: python script_name.py <trimix>")
-        sys.exit(1)
+    k_inert = _inert_specific_gravity(initial_he_percentage, initial_n2_percentage)
+    depths = _cc_depth_grid(k_inert, set_points, target_densities)
+    if np.isnan(depths).any():
+        raise ValueError("Target density cannot be reached without inert gas in the mix.")
+    return depths.astype(np.int64)
 
-    # Get the trimix specification from command line argument
-    trimix_input = sys.argv[1]
 
-    # Parse the input and get the gas percentages
-    o2_percentage, he_percentage, n2_percentage = parse_trimix(trimix_input)
+def compute_grid(o2_percentages, he_percentages, po2_targets, target_densities, set_points):
+    """
+    Calculate PO2, END and gas density limits for every candidate mix on a grid of O2 and He percentages, using the
+    same closed-form solutions as the scalar functions. Requires NumPy. Cells that parse_trimix would reject (no O2, or
+    O2 and He adding up to more than 100%) are NaN throughout, as are limits for which the scalar functions raise a
+    ValueError, such as the END of a mix without nitrogen.
+
+    Parameters:
+    o2_percentages (array-like): Candidate percentages of oxygen.
+    he_percentages (array-like): Candidate percentages of helium.
+    po2_targets (array-like): Target partial pressures of oxygen (PO2) in bar.
+    target_densities (array-like): Target gas densities in g/l.
+    set_points (array-like): Set points for PO2.
+
+    Returns:
+    tuple: Arrays of depths in meters, indexed by (O2, He, ...):
+        PO2 depths of shape (n_o2, n_he, n_po2),
+        depths for a 30m END of shape (n_o2, n_he),
+        OC gas density depths of shape (n_o2, n_he, n_density),
+        CC gas density depths of shape (n_o2, n_he, n_density, n_sp).
+    """
+    import numpy as np
+
+    o2 = np.asarray(o2_percentages, dtype=np.float64)[:, None]
+    he = np.asarray(he_percentages, dtype=np.float64)[None, :]
+    po2_targets = np.asarray(po2_targets, dtype=np.float64)
+    target_densities = np.asarray(target_densities, dtype=np.float64)
+    set_points = np.asarray(set_points, dtype=np.float64)
+    specific_gravities = np.asarray(_SPECIFIC_GRAVITIES)
+
+    n2 = 100 - o2 - he
+    n2 = np.where((n2 >= 0) & (o2 > 0), n2, np.nan)  # Marks invalid mixes so their results come out as NaN
+    inert = he + n2
+
+    # Percentages of (O2, N2, He) for every cell, shape (n_o2, n_he, 3)
+    mixes = np.stack(np.broadcast_arrays(o2, n2, he), axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        po2_depths = np.where(np.isnan(n2)[..., None], np.nan, (po2_targets * 100 / o2[..., None] - 1) * 10)
+
+        end_depths = np.where(n2 > 0, (0.79 * 4 * 100 / n2 - 1) * 10, np.nan)
 
-    # Output the results
-    print(f"Oxygen: {o2_percentage}%, Helium: {he_percentage}%, Nitrogen: {n2_percentage}%")
+        mix_sg_percent = mixes @ specific_gravities
+        oc_depths = np.maximum(np.ceil(10 * (target_densities * 100 / mix_sg_percent[..., None] - 1)), 0)
+
+        k_inert = np.where(inert == 0, 0, mixes[..., 1:] @ specific_gravities[1:] / inert)
+
+    cc_depths = _cc_depth_grid(k_inert, set_points, target_densities)
+
+    return po2_depths, end_depths, oc_depths, cc_depths
+
+
+# Targets reported by the CLI
+_PO2_TARGETS = (1.1, 1.4, 1.6)  # PO2 targets in bar
+_DENSITY_TARGETS = (5.2, 6.2)  # Soft and hard limits in g/l
+_SET_POINTS = (1.0, 1.1, 1.2, 1.3)  # CC set points in bar
+
+
+def report_rows(trimix):
+    """
+    Calculate the PO2, END and gas density limits reported for a trimix.
+
+    Parameters:
+    trimix (str): A string representing the trimix, e.g., '18/35' or '50'.
+
+    Returns:
+    list: Tuples of (metric, parameter, set point, depth). The metric is one of 'po2', 'end', 'density_oc' and
+    'density_cc'; the parameter is the PO2 in bar, the END in meters or the gas density in g/l; the set point is only
+    set for 'density_cc' and None otherwise. The depth is None for limits the mix never reaches.
+    """
+    # Parse the input and get the gas percentages
+    o2_percentage, he_percentage, n2_percentage = parse_trimix(trimix)
 
-    targets_po2 = [1.1, 1.4, 1.6]  # PO2 targets in bar
-    for po2 in targets_po2:
-        depth = calculate_depth_for_po2(po2, o2_percentage)
-        print(
-            f"PO2 of {po2} bar at {depth:.2f} meters.")
+    rows = []
+    for po2 in _PO2_TARGETS:
+        rows.append(('po2', po2, None, calculate_depth_for_po2(po2, o2_percentage)))
 
-    depth_for_30m_end = find_depth_for_30m_end(n2_percentage)
-    print(
-        f"END is 30 meters at {depth_for_30m_end:.2f} meters.")
+    # Heliox and pure O2 contain no nitrogen, so their END never reaches 30 meters
+    depth_for_30m_end = find_depth_for_30m_end(n2_percentage) if n2_percentage > 0 else None
+    rows.append(('end', 30, None, depth_for_30m_end))
 
-    target_densities = [5.2, 6.2]  # Hard nd soft limits in g/l
-    for target_density in target_densities:
+    for target_density in _DENSITY_TARGETS:
         depth_for_limit = calculate_depth_for_gas_density(o2_percentage, he_percentage, target_density)
-        print(
-            f"Depth for {target_density} g/l gas density is {depth_for_limit} meters on OC.")
-        # Now for OC
-        for setpoint in [1.0, 1.1, 1.2, 1.3]:
-            depth_for_limit = calculate_depth_for_sp_and_density(o2_percentage, he_percentage, n2_percentage, setpoint,
-                                                                 target_density)
-            print(
-                f"With SP {setpoint} the depth for {target_density} g/l is {depth_for_limit}."
-            )
+        rows.append(('density_oc', target_density, None, depth_for_limit))
+        # Now for CC
+        for setpoint in _SET_POINTS:
+            try:
+                depth_for_limit = calculate_depth_for_sp_and_density(o2_percentage, he_percentage, n2_percentage,
+                                                                     setpoint, target_density)
+            except ValueError:
+                # The CLI set points are all reachable, so only a mix without inert gas ends up here
+                depth_for_limit = None
+            rows.append(('density_cc', target_density, setpoint, depth_for_limit))
+
+    return rows
+
+
+def report_lines(trimix):
+    """
+    Build the human-readable report of PO2, END and gas density limits for a trimix.
+
+    Parameters:
+    trimix (str): A string representing the trimix, e.g., '18/35' or '50'.
+
+    Returns:
+    list: Lines of the report.
+    """
+    o2_percentage, he_percentage, n2_percentage = parse_trimix(trimix)
+    lines = [f"Oxygen: {o2_percentage}%, Helium: {he_percentage}%, Nitrogen: {n2_percentage}%"]
+
+    for metric, param, setpoint, depth in report_rows(trimix):
+        if metric == 'po2':
+            lines.append(f"PO2 of {param} bar at {depth:.2f} meters.")
+        elif depth is None:
+            if metric == 'end':
+                lines.append(f"END never reaches {param} meters without nitrogen in the mix.")
+            else:
+                lines.append(f"With SP {setpoint} a density of {param} g/l is never reached without inert gas in the mix.")
+        elif metric == 'end':
+            lines.append(f"END is {param} meters at {depth:.2f} meters.")
+        elif metric == 'density_oc':
+            lines.append(f"Depth for {param} g/l gas density is {depth} meters on OC.")
+        else:
+            lines.append(f"With SP {setpoint} the depth for {param} g/l is {depth}.")
+
+    return lines
+
+
+def write_csv(mixes, stream):
+    """
+    Write the PO2, END and gas density limits for several trimixes as CSV.
+
+    Parameters:
+    mixes (list): Trimix strings, e.g., ['18/35', '50'].
+    stream (file-like): Text stream to write to.
+    """
+    rows = [(trimix, *row) for trimix in mixes for row in report_rows(trimix)]
+
+    writer = csv.writer(stream, lineterminator="\n")
+    writer.writerow(['mix', 'metric', 'param', 'set_point', 'depth_m'])
+    for trimix, metric, param, setpoint, depth in rows:
+        if isinstance(depth, float):
+            depth = f"{depth:.2f}"
+        writer.writerow([trimix, metric, param, '' if setpoint is None else setpoint, depth])
+
+
+def main(argv=None):
+    """
+    Run the command line interface.
+
+    Parameters:
+    argv (list): Command line arguments without the program name; defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(description="Calculate PO2, END and gas density limits for trimix mixes.")
+    parser.add_argument('mixes', nargs='+', metavar='trimix', help="Mix as O2/He, e.g. '18/35', or O2 only, e.g. '50'")
+    parser.add_argument('--format', choices=['human', 'csv'], default='human', help="Output format (default: human)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.format == 'csv':
+            write_csv(args.mixes, sys.stdout)
+        else:
+            # Collect the reports for all mixes and write them out in one go
+            lines = []
+            for trimix_input in args.mixes:
+                if lines:
+                    lines.append("")
+                lines.extend(report_lines(trimix_input))
+            sys.stdout.write("\n".join(lines) + "\n")
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
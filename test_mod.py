@@ -0,0 +1,201 @@
+import pytest
+
+import mod
+
+
+def test_compute_density_depths_matches_scalar():
+    pytest.importorskip('numpy')
+    set_points = [1.0, 1.1, 1.2, 1.3]
+    target_densities = [2.0, 5.2, 6.2]
+    for o2, he, n2 in [(18, 35, 47), (21, 0, 79), (10, 70, 20), (21, 79, 0), (50, 0, 50)]:
+        depths = mod.compute_density_depths(o2, he, n2, set_points, target_densities)
+        expected = [[mod.calculate_depth_for_sp_and_density(o2, he, n2, sp, td) for sp in set_points]
+                    for td in target_densities]
+        assert depths.tolist() == expected
+
+
+def test_compute_density_depths_pure_o2():
+    pytest.importorskip('numpy')
+    assert mod.calculate_depth_for_sp_and_density(100, 0, 0, 1.3, 1.5) == 10
+    assert mod.compute_density_depths(100, 0, 0, [1.2, 1.3], [1.5]).tolist() == [[10, 10]]
+    with pytest.raises(ValueError):
+        mod.calculate_depth_for_sp_and_density(100, 0, 0, 1.0, 5.2)
+    with pytest.raises(ValueError):
+        mod.compute_density_depths(100, 0, 0, [1.0, 1.3], [5.2])
+
+
+def test_compute_density_depths_unreachable_set_point():
+    pytest.importorskip('numpy')
+    with pytest.raises(ValueError):
+        mod.compute_density_depths(18, 35, 47, [1.0, 2.0], [5.2])
+
+
+def test_parse_trimix():
+    assert mod.parse_trimix('18/35') == (18, 35, 47)
+    assert mod.parse_trimix('32') == (32, 0, 68)
+    assert mod.parse_trimix(' 21 / 79 ') == (21, 79, 0)
+
+
+@pytest.mark.parametrize('trimix', ['', 'x', '18/', '-5', '18/35/10', '80/30', '0', '0/50'])
+def test_parse_trimix_invalid(trimix):
+    with pytest.raises(ValueError):
+        mod.parse_trimix(trimix)
+
+
+def _iterative_oc_depth(o2, he, target_density):
+    # Reference: step down one meter at a time until the density is reached
+    n2 = 100 - o2 - he
+    depth = 0
+    while (1 + depth / 10) * (o2 * mod.SPECIFIC_GRAVITY_O2 + n2 * mod.SPECIFIC_GRAVITY_N2 +
+                              he * mod.SPECIFIC_GRAVITY_HE) / 100 < target_density:
+        depth += 1
+    return depth
+
+
+def _iterative_cc_depth(o2, he, n2, set_point, target_density):
+    # Reference: the loop gas is O2 at the set point, the rest is He and N2 in the ratio of the mix
+    depth = 10
+    while True:
+        ambient_pressure = 1 + depth / 10
+        frac_o2 = set_point / ambient_pressure
+        frac_he = he / (he + n2) * (1 - frac_o2)
+        frac_n2 = n2 / (he + n2) * (1 - frac_o2)
+        density = ambient_pressure * (frac_o2 * mod.SPECIFIC_GRAVITY_O2 + frac_n2 * mod.SPECIFIC_GRAVITY_N2 +
+                                      frac_he * mod.SPECIFIC_GRAVITY_HE)
+        if density >= target_density:
+            return depth
+        depth += 1
+
+
+@pytest.mark.parametrize('o2, he, target_density, depth', [
+    (18, 35, 5.2, 48),
+    (18, 35, 6.2, 59),
+    (32, 0, 5.2, 30),
+    (32, 0, 6.2, 38),
+    (21, 0, 0.5, 0),  # Already reached at the surface
+])
+def test_calculate_depth_for_gas_density(o2, he, target_density, depth):
+    assert mod.calculate_depth_for_gas_density(o2, he, target_density) == depth
+
+
+@pytest.mark.parametrize('o2, he, n2, set_point, target_density, depth', [
+    (18, 35, 47, 1.0, 5.2, 48),
+    (18, 35, 47, 1.0, 6.2, 61),
+    (18, 35, 47, 1.3, 5.2, 46),
+    (18, 35, 47, 1.3, 6.2, 58),
+    (32, 0, 68, 1.2, 5.2, 30),
+    (18, 35, 47, 1.3, 1.5, 10),  # Already reached at the 10 m start depth
+])
+def test_calculate_depth_for_sp_and_density(o2, he, n2, set_point, target_density, depth):
+    assert mod.calculate_depth_for_sp_and_density(o2, he, n2, set_point, target_density) == depth
+
+
+def test_closed_form_matches_iterative_reference():
+    for o2 in range(5, 101, 5):
+        for he in range(0, 101 - o2, 5):
+            n2 = 100 - o2 - he
+            for target_density in (1.5, 5.2, 6.2):
+                assert (mod.calculate_depth_for_gas_density(o2, he, target_density) ==
+                        _iterative_oc_depth(o2, he, target_density))
+                if he + n2 == 0:
+                    continue
+                for set_point in (0.7, 1.0, 1.3):
+                    assert (mod.calculate_depth_for_sp_and_density(o2, he, n2, set_point, target_density) ==
+                            _iterative_cc_depth(o2, he, n2, set_point, target_density))
+
+
+def test_calculate_depth_for_sp_and_density_unreachable_set_point():
+    with pytest.raises(ValueError):
+        mod.calculate_depth_for_sp_and_density(18, 35, 47, 2.0, 5.2)
+
+
+def test_main_human(capsys):
+    mod.main(['18/35'])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "Oxygen: 18%, Helium: 35%, Nitrogen: 47%"
+    assert "PO2 of 1.4 bar at 67.78 meters." in lines
+    assert "END is 30 meters at 57.23 meters." in lines
+    assert "Depth for 5.2 g/l gas density is 48 meters on OC." in lines
+    assert "With SP 1.0 the depth for 6.2 g/l is 61." in lines
+
+
+def test_main_several_mixes(capsys):
+    mod.main(['18/35', '32'])
+    reports = capsys.readouterr().out.split("\n\n")
+    assert len(reports) == 2
+    assert reports[0].startswith("Oxygen: 18%")
+    assert reports[1].startswith("Oxygen: 32%")
+
+
+def test_main_csv(capsys):
+    mod.main(['--format', 'csv', '18/35', '32'])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "mix,metric,param,set_point,depth_m"
+    assert "18/35,po2,1.4,,67.78" in lines
+    assert "18/35,end,30,,57.23" in lines
+    assert "18/35,density_oc,5.2,,48" in lines
+    assert "18/35,density_cc,6.2,1.0,61" in lines
+    assert "32,density_oc,6.2,,38" in lines
+    assert len(lines) == 1 + 2 * 14
+
+
+def test_main_without_nitrogen(capsys):
+    mod.main(['--format', 'csv', '21/79'])
+    assert "21/79,end,30,," in capsys.readouterr().out.splitlines()
+
+
+def test_main_invalid_mix(capsys):
+    with pytest.raises(SystemExit) as exc_info:
+        mod.main(['18/35', '80/30'])
+    assert exc_info.value.code == 2
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "O2 and He add up to more than 100%" in captured.err
+
+
+def test_compute_grid_matches_scalar():
+    np = pytest.importorskip('numpy')
+    o2s = [0, 10, 18, 21, 50, 100]
+    hes = [0, 35, 79, 90]
+    po2_targets = [1.1, 1.4]
+    target_densities = [1.5, 5.2]
+    set_points = [1.0, 1.3]
+    po2_depths, end_depths, oc_depths, cc_depths = mod.compute_grid(o2s, hes, po2_targets, target_densities,
+                                                                    set_points)
+    assert po2_depths.shape == (6, 4, 2)
+    assert end_depths.shape == (6, 4)
+    assert oc_depths.shape == (6, 4, 2)
+    assert cc_depths.shape == (6, 4, 2, 2)
+
+    for i, o2 in enumerate(o2s):
+        for j, he in enumerate(hes):
+            n2 = 100 - o2 - he
+            if o2 == 0 or n2 < 0:
+                # Mixes parse_trimix rejects
+                assert np.isnan(po2_depths[i, j]).all()
+                assert np.isnan(end_depths[i, j])
+                assert np.isnan(oc_depths[i, j]).all()
+                assert np.isnan(cc_depths[i, j]).all()
+                continue
+
+            assert np.allclose(po2_depths[i, j], [mod.calculate_depth_for_po2(po2, o2) for po2 in po2_targets])
+            if n2 == 0:
+                assert np.isnan(end_depths[i, j])
+            else:
+                assert np.isclose(end_depths[i, j], mod.find_depth_for_30m_end(n2))
+            assert oc_depths[i, j].tolist() == [mod.calculate_depth_for_gas_density(o2, he, target_density)
+                                                for target_density in target_densities]
+            for k, target_density in enumerate(target_densities):
+                for m, set_point in enumerate(set_points):
+                    try:
+                        depth = mod.calculate_depth_for_sp_and_density(o2, he, n2, set_point, target_density)
+                    except ValueError:
+                        assert np.isnan(cc_depths[i, j, k, m])
+                    else:
+                        assert cc_depths[i, j, k, m] == depth
+
+
+def test_compute_grid_unreachable_set_point():
+    pytest.importorskip('numpy')
+    with pytest.raises(ValueError):
+        mod.compute_grid([18], [35], [1.4], [5.2], [1.0, 2.0])